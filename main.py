@@ -1,18 +1,40 @@
 # main.py
+# Run with: uvicorn main:app --loop uvloop --http httptools --no-access-log --proxy-headers
+# (uvloop and httptools ship with uvicorn[standard]). Keep a single worker: the session cookie
+# set via /api/set_cookie and the ETag cache live in process memory and are not shared between workers.
+import asyncio
+import json
+import multiprocessing
 import os
 import shutil
 import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
 from typing import Optional, Tuple, List, Dict, Any
+from uuid import uuid4
 
 import httpx
+import orjson
 from bs4 import BeautifulSoup
+from lxml import etree
 from fastapi import FastAPI, Request, Response, HTTPException, Body, Query
 from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from jinja2 import Environment, FileSystemLoader
-import aiofiles
+from starlette.background import BackgroundTask
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import Markup
 
-app = FastAPI(title="BTU Courses - FastAPI proxy & scraper")
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson (fastapi.responses.ORJSONResponse is deprecated in recent FastAPI)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+app = FastAPI(title="BTU Courses - FastAPI proxy & scraper", default_response_class=ORJSONResponse)
 
 # Configuration - change if needed
 BASE_URL = "https://classroom.btu.edu.ge/en/student/me/courses"
@@ -21,97 +43,239 @@ TEMPLATE_NAME = "template.html"
 HTML_DIR = "html"
 COURSES_DIR = "courses"
 INDEX_HTML = "index.html"
+CACHE_DIR = "cache"
+ETAGS_FILE = os.path.join(CACHE_DIR, "etags.json")
+JINJA_CACHE_DIR = os.path.join(CACHE_DIR, "jinja")
+DOWNLOAD_CONCURRENCY = 16
 
 # In-memory cookie (can be set via API or env)
 COOKIE = os.getenv("BTU_COOKIE", None)
 
+# In-memory copy of INDEX_HTML served by GET / (loaded on first hit, replaced by /api/generate)
+INDEX_BYTES: Optional[bytes] = None
+
 # Ensure folders exist
 os.makedirs(HTML_DIR, exist_ok=True)
 os.makedirs(COURSES_DIR, exist_ok=True)
 os.makedirs(TEMPLATES_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
 
 # Jinja2 environment
-jinja_env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+jinja_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=True,
+    auto_reload=False,
+    cache_size=400,
+    bytecode_cache=FileSystemBytecodeCache(directory=JINJA_CACHE_DIR),
+)
+
+# Shared HTTP client (created on startup, reused by every fetch so connections stay alive)
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+@app.on_event("startup")
+async def startup_client():
+    app.state.client = httpx.AsyncClient(
+        http2=True,
+        timeout=30.0,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+        headers={"User-Agent": DEFAULT_USER_AGENT},
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_client():
+    await app.state.client.aclose()
+
+
+# Process pool for the CPU-bound parse_* calls (pure str -> dict functions, so arguments and results pickle cleanly).
+# Workers start via forkserver (spawn where that's unavailable, e.g. Windows): forking this process after the
+# to_thread pool is running could deadlock on a lock held by one of those threads.
+_PARSE_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+@app.on_event("startup")
+async def startup_parse_pool():
+    app.state.parse_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context(_PARSE_POOL_START_METHOD),
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_parse_pool():
+    app.state.parse_pool.shutdown(wait=False, cancel_futures=True)
+
 
 # --- Utility network functions (async using httpx) ---
-async def fetch_text(url: str, cookie: Optional[str] = None, client: Optional[httpx.AsyncClient] = None) -> str:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    }
+async def fetch_text(url: str, cookie: Optional[str] = None) -> str:
+    headers = {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"}
     if cookie:
         headers["Cookie"] = cookie
-    close_client = False
-    if client is None:
-        client = httpx.AsyncClient(timeout=30.0, follow_redirects=True)
-        close_client = True
+    r = await app.state.client.get(url, headers=headers)
+    r.raise_for_status()
+    return r.text
+
+
+# Validators from previous responses: {url: [etag, last_modified]} (persisted to ETAGS_FILE)
+def _load_etags() -> Dict[str, List[Optional[str]]]:
     try:
-        r = await client.get(url, headers=headers)
-        r.raise_for_status()
-        return r.text
-    finally:
-        if close_client:
-            await client.aclose()
+        with open(ETAGS_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+_etags = _load_etags()
+
+
+async def fetch_text_if_modified(url: str, cookie: Optional[str] = None, conditional: bool = True) -> Optional[Tuple[str, List[Optional[str]]]]:
+    """Like fetch_text, but sends the saved ETag/Last-Modified validators and returns None on 304 Not Modified.
+
+    Otherwise returns (text, [etag, last_modified]); the caller stores the validators with
+    remember_validators() once the body has been saved, so a failed write never leaves a
+    validator pointing at a stale file.
+    """
+    headers = {"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"}
+    if cookie:
+        headers["Cookie"] = cookie
+    if conditional:
+        etag, last_modified = _etags.get(url, (None, None))
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    r = await app.state.client.get(url, headers=headers)
+    if r.status_code == 304:
+        return None
+    r.raise_for_status()
+    return r.text, [r.headers.get("etag"), r.headers.get("last-modified")]
+
+
+def remember_validators(url: str, validators: List[Optional[str]]):
+    if any(validators):
+        _etags[url] = validators
+    else:
+        _etags.pop(url, None)
+
+
+async def fetch_bytes(url: str, cookie: Optional[str] = None) -> bytes:
+    headers = {"Accept": "*/*"}
+    if cookie:
+        headers["Cookie"] = cookie
+    r = await app.state.client.get(url, headers=headers, timeout=60.0)
+    r.raise_for_status()
+    return r.content
 
 
-async def fetch_bytes(url: str, cookie: Optional[str] = None, client: Optional[httpx.AsyncClient] = None) -> bytes:
-    headers = {"User-Agent": "Mozilla/5.0", "Accept": "*/*"}
+async def stream_to_file(url: str, path: str, cookie: Optional[str] = None, chunk_size: int = 65536):
+    """Stream a download straight to disk in chunks instead of buffering the whole body in memory."""
+    headers = {"Accept": "*/*"}
     if cookie:
         headers["Cookie"] = cookie
-    close_client = False
-    if client is None:
-        client = httpx.AsyncClient(timeout=60.0, follow_redirects=True)
-        close_client = True
+    dirpath = os.path.dirname(path)
+    if dirpath and not os.path.exists(dirpath):
+        os.makedirs(dirpath, exist_ok=True)
+    # write to a unique temp file so an interrupted download never looks like a finished file
+    # and concurrent downloads never share a partial file
+    # (opened with "xb" rather than tempfile.mkstemp so the file gets normal umask permissions, not 0600)
+    tmp_path = f"{path}.{uuid4().hex}.part"
     try:
-        r = await client.get(url, headers=headers)
-        r.raise_for_status()
-        return r.content
-    finally:
-        if close_client:
-            await client.aclose()
+        with open(tmp_path, "xb") as f:
+            async with app.state.client.stream("GET", url, headers=headers, timeout=60.0) as r:
+                r.raise_for_status()
+                async for chunk in r.aiter_bytes(chunk_size):
+                    await asyncio.to_thread(f.write, chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 # --- Parsing helpers (ported from your script) ---
+def _abs(href: str) -> str:
+    """Resolve href against BASE_URL, skipping the urljoin parse when it is already absolute."""
+    return href if href.startswith(("http://", "https://")) else urllib.parse.urljoin(BASE_URL, href)
+
+
 def parse_num(td_text: str):
     if td_text is None:
         return None
     txt = td_text.strip().replace(",", ".")
-    try:
-        return float(txt)
-    except Exception:
-        return txt.strip()
+    # only cells that start like a number are worth a float() attempt
+    if txt and (txt[0].isdigit() or txt[0] in "+-."):
+        try:
+            return float(txt)
+        except ValueError:
+            pass
+    return txt
+
+
+# Precompiled XPath selectors for the hot parsers (courses list and files tab)
+def _xp_has_class(cls: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+
+_HTML_PARSER = etree.HTMLParser(encoding="utf-8")
+XP_COURSE_ROWS = etree.XPath(
+    "((//table[" + " and ".join(_xp_has_class(c) for c in ("table", "table-striped", "table-bordered", "table-hover", "fluid")) + "])[1]//tbody)[1]//tr"
+)
+XP_TDS = etree.XPath(".//td")
+# text nodes as bs4's get_text() sees them: script/style/template contents are left out
+XP_TEXT = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+XP_FIRST_A = etree.XPath("(.//a)[1]")
+XP_FILES_ROWS = etree.XPath("(//*[@id='files'])[1]//tr")
+XP_LECTOR_A = etree.XPath("(.//a[contains(@href, '/lector/')])[1]")
+XP_UPLOAD_A = etree.XPath("(.//a[contains(@href, '/uploads/')])[1]")
+
+
+def _html_tree(html: str):
+    """Parse html into an lxml tree (None for an empty document).
+
+    Fed as UTF-8 bytes so pages starting with an <?xml ... encoding=...?> declaration parse too.
+    """
+    return etree.fromstring(html.encode("utf-8"), _HTML_PARSER)
+
+
+def _first(xpath: etree.XPath, el) -> Optional[etree._Element]:
+    found = xpath(el)
+    return found[0] if found else None
+
+
+def _text(el) -> str:
+    """Same as bs4's get_text(strip=True): every text node stripped and concatenated."""
+    return "".join(t.strip() for t in XP_TEXT(el))
 
 
 def parse_courses(html: str) -> Tuple[List[Dict[str, Any]], Optional[float]]:
-    soup = BeautifulSoup(html, "html.parser")
-    table = soup.select_one("table.table.table-striped.table-bordered.table-hover.fluid")
-    if not table:
-        return [], None
-    tbody = table.find("tbody")
-    if not tbody:
+    tree = _html_tree(html)
+    if tree is None:
         return [], None
 
     courses = []
     total_ects = None
 
-    for tr in tbody.find_all("tr"):
-        tds = tr.find_all("td")
+    for tr in XP_COURSE_ROWS(tree):
+        tds = XP_TDS(tr)
 
-        if len(tds) == 2 and not tds[0].get_text(strip=True):
-            total_ects = parse_num(tds[-1].get_text(strip=True))
+        if len(tds) == 2 and not _text(tds[0]):
+            total_ects = parse_num(_text(tds[-1]))
             continue
 
         if len(tds) != 6:
             continue
 
-        name_a = tds[2].find("a")
-        name = name_a.get_text(strip=True) if name_a else tds[2].get_text(strip=True)
-        grade = parse_num(tds[3].get_text(strip=True))
-        ects = parse_num(tds[5].get_text(strip=True))
-        url = name_a["href"] if name_a and name_a.has_attr("href") else None
+        name_a = _first(XP_FIRST_A, tds[2])
+        name = _text(name_a) if name_a is not None else _text(tds[2])
+        grade = parse_num(_text(tds[3]))
+        ects = parse_num(_text(tds[5]))
+        url = name_a.get("href") if name_a is not None else None
 
         # Ensure absolute URL if relative
-        if url and not urllib.parse.urlparse(url).netloc:
-            url = urllib.parse.urljoin(BASE_URL, url)
+        if url:
+            url = _abs(url)
 
         courses.append({"name": name, "grade": grade, "ects": ects, "url": url})
 
@@ -119,30 +283,33 @@ def parse_courses(html: str) -> Tuple[List[Dict[str, Any]], Optional[float]]:
 
 
 def extract_course_urls(html: str) -> Dict[str, str]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "lxml")
     urls = {}
     tabs = soup.select_one("#course_tabs")
     if tabs:
         for link in tabs.find_all("a", href=True):
             href = link["href"]
             if "silabus" in href:
-                urls["syllabus"] = urllib.parse.urljoin(BASE_URL, href)
+                urls["syllabus"] = _abs(href)
             elif "groups" in href:
-                urls["groups"] = urllib.parse.urljoin(BASE_URL, href)
+                urls["groups"] = _abs(href)
             elif "scores" in href:
-                urls["scores"] = urllib.parse.urljoin(BASE_URL, href)
+                urls["scores"] = _abs(href)
             elif "files" in href:
-                urls["files"] = urllib.parse.urljoin(BASE_URL, href)
+                urls["files"] = _abs(href)
     syllabus_file = soup.select_one('a[href*="courseSilabusFile"]')
     if syllabus_file:
         href = syllabus_file["href"]
-        urls["syllabus_file"] = urllib.parse.urljoin(BASE_URL, href)
+        urls["syllabus_file"] = _abs(href)
     return urls
 
 
 import re
+_MAX_RE = re.compile(r'max\.?\s*([\d.,]+)')
+
+
 def parse_scores(html: str) -> Dict[str, Any]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "lxml")
     data = {"group": None, "lector": None, "assessments": []}
     h4 = soup.select_one(".tab_scores h4")
     if h4:
@@ -165,7 +332,7 @@ def parse_scores(html: str) -> Dict[str, Any]:
                 continue
             if component:
                 max_points = None
-                max_match = re.search(r'max\.?\s*([\d.,]+)', component)
+                max_match = _MAX_RE.search(component)
                 if max_match:
                     try:
                         max_points = float(max_match.group(1).replace(",", "."))
@@ -176,40 +343,40 @@ def parse_scores(html: str) -> Dict[str, Any]:
 
 
 def parse_files(html: str, my_lector: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
-    soup = BeautifulSoup(html, "html.parser")
+    tree = _html_tree(html)
     materials = []
-    current_lector = None
-    table = soup.select_one("#files")
-    if not table:
+    current_lector_lc = None
+    my_lector_lc = my_lector.lower() if my_lector else None
+    if tree is None:
         return materials
-    for tr in table.find_all("tr"):
-        lector_link = tr.select_one("a[href*='/lector/']")
-        tr_class = tr.get("class") or []
-        if lector_link and "info" in tr_class:
-            current_lector = lector_link.get_text(strip=True)
+    for tr in XP_FILES_ROWS(tree):
+        lector_link = _first(XP_LECTOR_A, tr)
+        tr_class = (tr.get("class") or "").split()
+        if lector_link is not None and "info" in tr_class:
+            current_lector_lc = _text(lector_link).lower()
             continue
-        if my_lector and current_lector and current_lector.lower() != my_lector.lower():
+        if my_lector_lc and current_lector_lc and current_lector_lc != my_lector_lc:
             continue
-        tds = tr.find_all("td")
+        tds = XP_TDS(tr)
         if not tds:
             continue
-        file_link = tds[0].select_one("a[href*='/uploads/']")
-        name = tds[0].get_text(strip=True)
-        url = file_link["href"] if file_link and file_link.get("href") else None
+        file_link = _first(XP_UPLOAD_A, tds[0])
+        name = _text(tds[0])
+        url = file_link.get("href") if file_link is not None else None
         # convert to absolute
         if url:
-            url = urllib.parse.urljoin(BASE_URL, url)
-        ext_link = tds[1].select_one("a") if len(tds) > 1 else None
-        ext_url = ext_link["href"] if ext_link else None
+            url = _abs(url)
+        ext_link = _first(XP_FIRST_A, tds[1]) if len(tds) > 1 else None
+        ext_url = ext_link.get("href") if ext_link is not None else None
         if ext_url:
-            ext_url = urllib.parse.urljoin(BASE_URL, ext_url)
+            ext_url = _abs(ext_url)
         if name:
             materials.append({"name": name, "url": url, "external_url": ext_url})
     return materials
 
 
 def parse_groups(html: str) -> Dict[str, List[str]]:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "lxml")
     table = soup.select_one("#groups")
     if not table:
         return {"groups": []}
@@ -223,96 +390,131 @@ def parse_groups(html: str) -> Dict[str, List[str]]:
     return {"groups": groups}
 
 
-# Helper to write files async
-async def save_bytes(path: str, data: bytes):
-    dirpath = os.path.dirname(path)
-    if dirpath and not os.path.exists(dirpath):
-        os.makedirs(dirpath, exist_ok=True)
-    async with aiofiles.open(path, "wb") as f:
-        await f.write(data)
+# Helpers to read/write files off the event loop (one threadpool hop per file)
+def _sync_read_text(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _sync_write_text(path: str, data: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+
+
+def list_folder(path: str) -> set:
+    """Names of the entries in path (empty if missing): one directory read instead of a stat per file."""
+    try:
+        with os.scandir(path) as it:
+            return {e.name for e in it}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
 
 
 # --- High-level flow functions ---
+class _SafeNameTable(dict):
+    """str.translate table keeping alphanumerics, space, "-" and "_"; filled lazily per code point."""
+
+    def __missing__(self, cp: int) -> Optional[int]:
+        ch = chr(cp)
+        keep = cp if ch.isalnum() or ch in (" ", "-", "_") else None
+        self[cp] = keep
+        return keep
+
+
+_SAFE_NAME_TABLE = _SafeNameTable()
+
+
+@lru_cache(maxsize=512)
+def safe_course_name(name: str) -> str:
+    """Course name reduced to characters that are safe in a folder name."""
+    return name.translate(_SAFE_NAME_TABLE).strip()
+
+
 async def fetch_course_pages(course: Dict[str, Any], cookie: Optional[str] = None) -> Dict[str, Any]:
     """Fetch course main page and detect subpages (syllabus, files, scores, groups). Write course html to html/<course_name>/course.html"""
     if not course.get("url"):
         return {}
-    course_name = course["name"]
-    safe_name = "".join(c for c in course_name if c.isalnum() or c in (" ", "-", "_")).strip()
+    safe_name = course.get("_safe") or safe_course_name(course["name"])
     html_folder = os.path.join(HTML_DIR, safe_name)
     course_folder = os.path.join(COURSES_DIR, safe_name)
-    os.makedirs(html_folder, exist_ok=True)
-    os.makedirs(course_folder, exist_ok=True)
-    os.makedirs(os.path.join(course_folder, "material"), exist_ok=True)
+    # recreated every call so deleting html/<course> to force a refetch keeps working
+    Path(html_folder).mkdir(parents=True, exist_ok=True)
+    Path(course_folder, "material").mkdir(parents=True, exist_ok=True)
 
     course_html = await fetch_text(course["url"], cookie=cookie)
     # save course.html
-    async with aiofiles.open(os.path.join(html_folder, "course.html"), "w", encoding="utf-8") as f:
-        await f.write(course_html)
+    await asyncio.to_thread(_sync_write_text, os.path.join(html_folder, "course.html"), course_html)
+    # files present in html_folder, kept up to date as subpages are written below
+    html_files = await asyncio.to_thread(list_folder, html_folder)
 
     urls = extract_course_urls(course_html)
     # fetch subpages according to rules in your script
-    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-        for name, url in urls.items():
-            if name == "syllabus_file":
-                # syllabus pdf - skip if exists in course_folder
-                out_pdf = os.path.join(course_folder, "syllabus.pdf")
-                if not os.path.exists(out_pdf):
-                    try:
-                        b = await fetch_bytes(url, cookie=cookie, client=client)
-                        await save_bytes(os.path.join(html_folder, f"{name}.pdf"), b)
-                        await save_bytes(out_pdf, b)
-                    except Exception as e:
-                        # ignore download errors, continue
-                        print("syllabus download failed", e)
-            elif name == "scores":
-                # always refetch
+    async def _fetch_one(name: str, url: str):
+        if name == "syllabus_file":
+            # syllabus pdf - skip if exists in course_folder
+            out_pdf = os.path.join(course_folder, "syllabus.pdf")
+            if not os.path.exists(out_pdf):
                 try:
-                    txt = await fetch_text(url, cookie=cookie, client=client)
-                    async with aiofiles.open(os.path.join(html_folder, f"{name}.html"), "w", encoding="utf-8") as f:
-                        await f.write(txt)
+                    await stream_to_file(url, out_pdf, cookie=cookie)
+                    await asyncio.to_thread(shutil.copyfile, out_pdf, os.path.join(html_folder, f"{name}.pdf"))
+                    html_files.add(f"{name}.pdf")
                 except Exception as e:
-                    print("scores fetch failed", e)
-            elif name == "files":
+                    # ignore download errors, continue
+                    print("syllabus download failed", e)
+        elif name in ("scores", "files"):
+            # always revalidate; keep the saved copy when upstream answers 304 Not Modified
+            path_html = os.path.join(html_folder, f"{name}.html")
+            try:
+                fetched = await fetch_text_if_modified(url, cookie=cookie, conditional=f"{name}.html" in html_files)
+                if fetched is not None:
+                    txt, validators = fetched
+                    await asyncio.to_thread(_sync_write_text, path_html, txt)
+                    html_files.add(f"{name}.html")
+                    remember_validators(url, validators)
+            except Exception as e:
+                print(f"{name} fetch failed", e)
+        else:
+            # groups or syllabus - don't refetch if exists
+            path_html = os.path.join(html_folder, f"{name}.html")
+            if f"{name}.html" not in html_files:
                 try:
-                    txt = await fetch_text(url, cookie=cookie, client=client)
-                    async with aiofiles.open(os.path.join(html_folder, f"{name}.html"), "w", encoding="utf-8") as f:
-                        await f.write(txt)
+                    txt = await fetch_text(url, cookie=cookie)
+                    await asyncio.to_thread(_sync_write_text, path_html, txt)
+                    html_files.add(f"{name}.html")
                 except Exception as e:
-                    print("files fetch failed", e)
-            else:
-                # groups or syllabus - don't refetch if exists
-                path_html = os.path.join(html_folder, f"{name}.html")
-                if not os.path.exists(path_html):
-                    try:
-                        txt = await fetch_text(url, cookie=cookie, client=client)
-                        async with aiofiles.open(path_html, "w", encoding="utf-8") as f:
-                            await f.write(txt)
-                    except Exception as e:
-                        print(f"{name} fetch failed", e)
+                    print(f"{name} fetch failed", e)
+
+    await asyncio.gather(*[_fetch_one(name, url) for name, url in urls.items()])
+
+    return {"course_html_path": os.path.join(html_folder, "course.html"), "urls": urls, "html_folder": html_folder, "html_files": html_files, "course_folder": course_folder}
 
-    return {"course_html_path": os.path.join(html_folder, "course.html"), "urls": urls, "html_folder": html_folder, "course_folder": course_folder}
 
+async def run_parser(func, *args):
+    """Run a parse_* function in the parse process pool without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(app.state.parse_pool, func, *args)
 
-async def parse_course_data_from_folder(html_folder: str) -> Dict[str, Any]:
-    """Read scores.html, files.html, groups.html from html_folder (if present) and parse."""
+
+async def parse_course_data_from_folder(html_folder: str, html_files: Optional[set] = None) -> Dict[str, Any]:
+    """Read scores.html, files.html, groups.html from html_folder (if present) and parse.
+
+    html_files is the folder listing if the caller already has it (see fetch_course_pages).
+    """
+    if html_files is None:
+        html_files = await asyncio.to_thread(list_folder, html_folder)
     data = {}
     scores_path = os.path.join(html_folder, "scores.html")
-    if os.path.exists(scores_path):
-        async with aiofiles.open(scores_path, encoding="utf-8") as f:
-            txt = await f.read()
-        data["scores"] = parse_scores(txt)
+    if "scores.html" in html_files:
+        txt = await asyncio.to_thread(_sync_read_text, scores_path)
+        data["scores"] = await run_parser(parse_scores, txt)
     my_lector = data.get("scores", {}).get("lector")
     files_path = os.path.join(html_folder, "files.html")
-    if os.path.exists(files_path):
-        async with aiofiles.open(files_path, encoding="utf-8") as f:
-            txt = await f.read()
-        data["materials"] = parse_files(txt, my_lector)
+    if "files.html" in html_files:
+        txt = await asyncio.to_thread(_sync_read_text, files_path)
+        data["materials"] = await run_parser(parse_files, txt, my_lector)
     groups_path = os.path.join(html_folder, "groups.html")
-    if os.path.exists(groups_path):
-        async with aiofiles.open(groups_path, encoding="utf-8") as f:
-            txt = await f.read()
-        data["groups"] = parse_groups(txt)
+    if "groups.html" in html_files:
+        txt = await asyncio.to_thread(_sync_read_text, groups_path)
+        data["groups"] = await run_parser(parse_groups, txt)
     return data
 
 
@@ -323,45 +525,36 @@ def fmt_num(val):
     return str(val)
 
 
-def get_grade_color(grade: float) -> str:
-    if grade >= 91:
-        return "#22c55e"
-    elif grade >= 81:
-        return "#84cc16"
-    elif grade >= 71:
-        return "#eab308"
-    elif grade >= 61:
-        return "#f97316"
-    elif grade >= 51:
-        return "#ef4444"
-    else:
-        return "#991b1b"
+# Grade bands: a score >= _BAND_THRESHOLDS[i - 1] falls into band i
+_BAND_THRESHOLDS = (51, 61, 71, 81, 91)
+_BAND_COLORS = ("#991b1b", "#ef4444", "#f97316", "#eab308", "#84cc16", "#22c55e")
+_BAND_GPA_POINTS = (0.0, 0.5, 1.0, 2.0, 3.0, 4.0)
 
 
 def get_percentage_color(percentage: float) -> str:
-    if percentage >= 91:
-        return "#22c55e"
-    elif percentage >= 81:
-        return "#84cc16"
-    elif percentage >= 71:
-        return "#eab308"
-    elif percentage >= 61:
-        return "#f97316"
-    elif percentage >= 51:
-        return "#ef4444"
-    else:
-        return "#991b1b"
+    return _BAND_COLORS[bisect_right(_BAND_THRESHOLDS, percentage)]
+
+
+def get_gpa_points(percentage: float) -> float:
+    return _BAND_GPA_POINTS[bisect_right(_BAND_THRESHOLDS, percentage)]
 
 
-def generate_course_html(course: Dict[str, Any], data: Dict[str, Any]) -> str:
+def course_max_possible(data: Dict[str, Any]) -> float:
+    """Sum of max points over the assessments that already have a score."""
+    return sum(a["max_points"] for a in data.get("scores", {}).get("assessments", []) if a.get("score") and a.get("max_points"))
+
+
+def precompute_course_stats(courses_data: List[tuple]) -> Dict[int, float]:
+    """Max possible points per course, keyed by id(course), computed once for both HTML generators."""
+    return {id(course): course_max_possible(data) for course, data in courses_data}
+
+
+def generate_course_html(course: Dict[str, Any], data: Dict[str, Any], stats: Optional[Dict[int, float]] = None) -> str:
     scores = data.get("scores", {})
     materials = data.get("materials", [])
     grade = course["grade"]
 
-    max_possible = 0
-    for a in scores.get("assessments", []):
-        if a.get("score") and a.get("max_points"):
-            max_possible += a["max_points"]
+    max_possible = stats[id(course)] if stats is not None else course_max_possible(data)
 
     if isinstance(grade, (int, float)) and max_possible > 0:
         try:
@@ -375,7 +568,7 @@ def generate_course_html(course: Dict[str, Any], data: Dict[str, Any]) -> str:
         else:
             pct_badge = ""
     elif isinstance(grade, (int, float)):
-        grade_color = get_grade_color(float(grade))
+        grade_color = get_percentage_color(float(grade))
         grade_display = fmt_num(grade)
         pct_badge = ""
     else:
@@ -384,12 +577,12 @@ def generate_course_html(course: Dict[str, Any], data: Dict[str, Any]) -> str:
         pct_badge = ""
 
     # safe course folder used for file links
-    course_folder = os.path.join(COURSES_DIR, "".join(c for c in course["name"] if c.isalnum() or c in (" ", "-", "_")).strip())
+    course_folder = os.path.join(COURSES_DIR, course.get("_safe") or safe_course_name(course["name"]))
     syllabus_path = os.path.join(course_folder, "syllabus.pdf")
     has_syllabus = os.path.exists(syllabus_path) or bool(data.get("syllabus_file"))
 
     # Build assessments HTML
-    assessments_html = ""
+    assessments_parts = []
     for a in scores.get("assessments", []):
         raw_score = a["score"]
         max_points = a.get("max_points")
@@ -424,7 +617,8 @@ def generate_course_html(course: Dict[str, Any], data: Dict[str, Any]) -> str:
         name = a["component"]
         if "(" in name:
             name = name.split("(")[0].strip()
-        assessments_html += f'<span class="assessment"><span class="assessment-name">{name}</span><span class="assessment-score{score_class}">{score_display}</span>{pct}</span>'
+        assessments_parts.append(f'<span class="assessment"><span class="assessment-name">{name}</span><span class="assessment-score{score_class}">{score_display}</span>{pct}</span>')
+    assessments_html = "".join(assessments_parts)
 
     syllabus_html = ""
     if has_syllabus and data.get("syllabus_file"):
@@ -435,11 +629,12 @@ def generate_course_html(course: Dict[str, Any], data: Dict[str, Any]) -> str:
 
     materials_html = ""
     if materials:
-        material_links = ""
+        material_parts = []
         for m in materials:
             if m["url"]:
                 prox = f'/api/proxy?url={urllib.parse.quote(m["url"], safe="")}'
-                material_links += f'<a href="{prox}" class="material" target="_blank">{m["name"]}</a>'
+                material_parts.append(f'<a href="{prox}" class="material" target="_blank">{m["name"]}</a>')
+        material_links = "".join(material_parts)
         materials_html = f'''<div class="materials-section">
             <div class="materials-toggle"><span class="arrow">▶</span> Materials ({len(materials)})</div>
             <div class="materials">{material_links}</div>
@@ -460,7 +655,7 @@ def generate_course_html(course: Dict[str, Any], data: Dict[str, Any]) -> str:
 </div>'''
 
 
-def generate_summary_html(courses_data: List[tuple], total_ects: Optional[float]) -> str:
+def generate_summary_html(courses_data: List[tuple], total_ects: Optional[float], stats: Optional[Dict[int, float]] = None) -> str:
     total_score = 0
     total_max_possible = 0
     total_ects_earned = 0
@@ -471,10 +666,7 @@ def generate_summary_html(courses_data: List[tuple], total_ects: Optional[float]
         ects = course["ects"]
         if isinstance(grade, (int, float)):
             total_score += grade
-        course_max = 0
-        for a in data.get("scores", {}).get("assessments", []):
-            if a.get("score") and a.get("max_points"):
-                course_max += a["max_points"]
+        course_max = stats[id(course)] if stats is not None else course_max_possible(data)
         total_max_possible += course_max
         if isinstance(grade, (int, float)) and course_max > 0 and isinstance(ects, (int, float)):
             pct = (grade / course_max) * 100
@@ -482,19 +674,7 @@ def generate_summary_html(courses_data: List[tuple], total_ects: Optional[float]
             total_ects_earned += ects
     weighted_gpa = 0
     for pct, ects in course_percentages:
-        if pct >= 91:
-            gpa_points = 4.0
-        elif pct >= 81:
-            gpa_points = 3.0
-        elif pct >= 71:
-            gpa_points = 2.0
-        elif pct >= 61:
-            gpa_points = 1.0
-        elif pct >= 51:
-            gpa_points = 0.5
-        else:
-            gpa_points = 0.0
-        weighted_gpa += gpa_points * ects
+        weighted_gpa += get_gpa_points(pct) * ects
     gpa = weighted_gpa / total_ects_earned if total_ects_earned > 0 else 0
     gpa_pct = (gpa / 4.0) * 100
     gpa_color = get_percentage_color(gpa_pct)
@@ -525,18 +705,18 @@ def generate_summary_html(courses_data: List[tuple], total_ects: Optional[float]
 
 
 def generate_dashboard_html(courses_data: List[tuple], total_ects: Optional[float] = None) -> str:
-    # Read template
-    template_path = os.path.join(TEMPLATES_DIR, TEMPLATE_NAME)
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Template not found at {template_path}. Place your HTML template there.")
-    template = jinja_env.get_template(TEMPLATE_NAME).render()  # we'll replace placeholders manually as in your script
+    # Read template (raises jinja2.TemplateNotFound if it hasn't been placed in TEMPLATES_DIR)
+    template = jinja_env.get_template(TEMPLATE_NAME)
 
     # build courses html
-    courses_html = ""
-    for course, data in courses_data:
-        courses_html += generate_course_html(course, data)
-    summary_html = generate_summary_html(courses_data, total_ects)
-    rendered = template.replace("{{COURSES}}", courses_html).replace("{{SUMMARY}}", summary_html)
+    stats = precompute_course_stats(courses_data)
+    courses_html = Markup("".join(generate_course_html(course, data, stats) for course, data in courses_data))
+    summary_html = Markup(generate_summary_html(courses_data, total_ects, stats))
+    # template uses {{ courses_html|safe }} / {{ summary_html|safe }}
+    rendered = template.render(courses_html=courses_html, summary_html=summary_html)
+    # older templates emit literal {{COURSES}} / {{SUMMARY}} (wrapped in {% raw %}) to be replaced after rendering
+    if "{{COURSES}}" in rendered or "{{SUMMARY}}" in rendered:
+        rendered = rendered.replace("{{COURSES}}", courses_html).replace("{{SUMMARY}}", summary_html)
     return rendered
 
 
@@ -573,19 +753,21 @@ async def api_proxy(url: str = Query(...)):
     if not url:
         raise HTTPException(status_code=400, detail="Missing url")
     # use httpx streaming
-    headers = {"User-Agent": "Mozilla/5.0", "Accept": "*/*"}
+    headers = {"Accept": "*/*"}
     if COOKIE:
         headers["Cookie"] = COOKIE
-    async with httpx.AsyncClient(timeout=120.0, follow_redirects=True) as client:
-        r = await client.get(url, headers=headers, stream=True)
-        if r.status_code >= 400:
+    client = app.state.client
+    req = client.build_request("GET", url, headers=headers, timeout=120.0)
+    r = await client.send(req, stream=True)
+    if r.status_code >= 400:
+        try:
             return Response(content=await r.aread(), status_code=r.status_code)
-        content_type = r.headers.get("content-type", "application/octet-stream")
-        # Create generator for streaming
-        async def streamer():
-            async for chunk in r.aiter_bytes():
-                yield chunk
-        return StreamingResponse(streamer(), media_type=content_type)
+        finally:
+            await r.aclose()
+    content_type = r.headers.get("content-type", "application/octet-stream")
+    # upstream response stays open while streaming and is closed once the body has been sent;
+    # aiter_bytes() decodes any Content-Encoding since only content-type is forwarded
+    return StreamingResponse(r.aiter_bytes(), media_type=content_type, background=BackgroundTask(r.aclose))
 
 @app.get("/api/courses")
 async def api_courses():
@@ -601,18 +783,23 @@ async def api_generate(refetch: bool = Body(False)):
     Full flow: fetch courses, then for each course fetch course pages (scores/files), parse them,
     download materials (into courses/<name>/material) and write index.html to disk. Returns a simple status.
     """
+    global INDEX_BYTES
     html = await fetch_text(BASE_URL, cookie=COOKIE)
     courses, total_ects = parse_courses(html)
+    for course in courses:
+        course["_safe"] = safe_course_name(course["name"])
+
+    # fetch course pages (and save relevant html & pdfs) for all courses at once
+    results = await asyncio.gather(*[fetch_course_pages(c, cookie=COOKIE) for c in courses])
+
+    # parse data from saved html folders (courses are parsed in parallel by the parse pool)
+    parsed = await asyncio.gather(*[parse_course_data_from_folder(res.get("html_folder", ""), res.get("html_files")) for res in results])
 
     courses_data = []
-    idx = 0
-    for course in courses:
-        idx += 1
-        # fetch course pages (and save relevant html & pdfs)
-        res = await fetch_course_pages(course, cookie=COOKIE)
-        # parse data from saved html folder
-        data = await parse_course_data_from_folder(res.get("html_folder", ""))
-        # download materials now (if any)
+    downloads = []
+    queued = set()
+    for course, res, data in zip(courses, results, parsed):
+        # queue material downloads (if any)
         materials = data.get("materials", [])
         course_folder = res.get("course_folder")
         if materials and course_folder:
@@ -621,19 +808,30 @@ async def api_generate(refetch: bool = Body(False)):
                     continue
                 filename = os.path.basename(urllib.parse.urlparse(m["url"]).path)
                 outpath = os.path.join(course_folder, "material", filename)
-                if os.path.exists(outpath):
+                # several materials can share a filename; only the first one is downloaded (as before)
+                if outpath in queued or os.path.exists(outpath):
                     continue
-                try:
-                    b = await fetch_bytes(m["url"], cookie=COOKIE)
-                    await save_bytes(outpath, b)
-                except Exception as e:
-                    print("Failed to download", m.get("url"), e)
+                queued.add(outpath)
+                downloads.append((m["url"], outpath))
         courses_data.append((course, data))
 
+    # download materials concurrently, bounded so the upstream server isn't flooded
+    sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async def _download(url: str, outpath: str):
+        async with sem:
+            try:
+                await stream_to_file(url, outpath, cookie=COOKIE)
+            except Exception as e:
+                print("Failed to download", url, e)
+
+    await asyncio.gather(*[_download(url, outpath) for url, outpath in downloads])
+    await asyncio.to_thread(_sync_write_text, ETAGS_FILE, json.dumps(_etags))
+
     # generate dashboard HTML and save to INDEX_HTML
     dashboard_html = generate_dashboard_html(courses_data, total_ects)
-    async with aiofiles.open(INDEX_HTML, "w", encoding="utf-8") as f:
-        await f.write(dashboard_html)
+    await asyncio.to_thread(_sync_write_text, INDEX_HTML, dashboard_html)
+    INDEX_BYTES = dashboard_html.encode("utf-8")
 
     return {"status": "ok", "courses_count": len(courses_data)}
 
@@ -641,11 +839,16 @@ async def api_generate(refetch: bool = Body(False)):
 # Serve static files and index.html
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+_NOT_GENERATED_BYTES = b"<html><body><h3>Index not generated yet.</h3><p>Call POST /api/generate to produce dashboard (set cookie first via /api/set_cookie).</p></body></html>"
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
-    # If index.html exists in project root (generated), serve it; otherwise inform to generate
-    if os.path.exists(INDEX_HTML):
-        async with aiofiles.open(INDEX_HTML, encoding="utf-8") as f:
-            return HTMLResponse(await f.read())
+    # If index.html exists in project root (generated), serve it from memory; otherwise inform to generate
+    global INDEX_BYTES
+    if INDEX_BYTES is None and os.path.exists(INDEX_HTML):
+        INDEX_BYTES = (await asyncio.to_thread(_sync_read_text, INDEX_HTML)).encode("utf-8")
+    if INDEX_BYTES is not None:
+        return HTMLResponse(INDEX_BYTES)
     else:
-        return HTMLResponse("<html><body><h3>Index not generated yet.</h3><p>Call POST /api/generate to produce dashboard (set cookie first via /api/set_cookie).</p></body></html>")
+        return HTMLResponse(_NOT_GENERATED_BYTES)